@@ -1,7 +1,12 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import csv
 import os
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from disk_cache import disk_cache
 
 # 🔑 Lấy API Key từ biến môi trường (set trong GitHub Secrets)
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
@@ -16,68 +21,114 @@ CITIES = {
 
 # 📂 Tên file CSV (luôn tạo mới ở chế độ reset)
 CSV_FILE = "weather_air_quality.csv"
+HEADER = [
+    "datetime", "city",
+    "temp", "humidity", "weather", "wind_speed",
+    "aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10"
+]
+
+# ♻️ Thời hạn cache kết quả API (giây) — chạy lại trong 1 giờ sẽ không gọi API nữa
+CACHE_TTL = 3600
+
+# ⏱ Timeout (giây) cho mỗi request API
+REQUEST_TIMEOUT = 5
+
+# 🔗 Dùng chung 1 Session để tái sử dụng kết nối (keep-alive) giữa các lần gọi API
+SESSION = requests.Session()
+_retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=_retry)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 # 📡 Hàm lấy dữ liệu thời tiết
+@disk_cache(ttl_seconds=CACHE_TTL)
+def fetch_weather(lat, lon):
+    url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
+    res = SESSION.get(url, timeout=REQUEST_TIMEOUT)
+    res.raise_for_status()
+    data = res.json()
+    return {
+        "temp": data["main"]["temp"],
+        "humidity": data["main"]["humidity"],
+        "weather": data["weather"][0]["main"],
+        "wind_speed": data["wind"]["speed"],
+    }
+
 def get_weather(lat, lon):
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
-        res = requests.get(url)
-        res.raise_for_status()
-        data = res.json()
-        return {
-            "temp": data["main"]["temp"],
-            "humidity": data["main"]["humidity"],
-            "weather": data["weather"][0]["main"],
-            "wind_speed": data["wind"]["speed"],
-        }
+        return fetch_weather(lat, lon)
     except Exception:
         return {"temp": "N/A", "humidity": "N/A", "weather": "N/A", "wind_speed": "N/A"}
 
 # 📡 Hàm lấy dữ liệu chất lượng không khí
+@disk_cache(ttl_seconds=CACHE_TTL)
+def fetch_air_quality(lat, lon):
+    url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}"
+    res = SESSION.get(url, timeout=REQUEST_TIMEOUT)
+    res.raise_for_status()
+    data = res.json()["list"][0]
+    return {
+        "aqi": data["main"]["aqi"],
+        "co": data["components"]["co"],
+        "no": data["components"]["no"],
+        "no2": data["components"]["no2"],
+        "o3": data["components"]["o3"],
+        "so2": data["components"]["so2"],
+        "pm2_5": data["components"]["pm2_5"],
+        "pm10": data["components"]["pm10"],
+    }
+
 def get_air_quality(lat, lon):
     try:
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}"
-        res = requests.get(url)
-        res.raise_for_status()
-        data = res.json()["list"][0]
-        return {
-            "aqi": data["main"]["aqi"],
-            "co": data["components"]["co"],
-            "no": data["components"]["no"],
-            "no2": data["components"]["no2"],
-            "o3": data["components"]["o3"],
-            "so2": data["components"]["so2"],
-            "pm2_5": data["components"]["pm2_5"],
-            "pm10": data["components"]["pm10"],
-        }
+        return fetch_air_quality(lat, lon)
     except Exception:
         return {"aqi": "N/A", "co": "N/A", "no": "N/A", "no2": "N/A", "o3": "N/A",
                 "so2": "N/A", "pm2_5": "N/A", "pm10": "N/A"}
 
+# 🔍 So sánh dữ liệu mới với file CSV hiện có (bỏ qua cột datetime)
+def same_data(rows):
+    if not os.path.exists(CSV_FILE):
+        return False
+    with open(CSV_FILE, newline="", encoding="utf-8") as f:
+        old = list(csv.reader(f))[1:]
+    new = [[str(v) for v in row] for row in rows]
+    return [r[1:] for r in old] == [r[1:] for r in new]
+
 # 📝 Crawl và lưu dữ liệu
 def crawl_and_save():
     # Lấy thời gian hiện tại (UTC+7)
-    timestamp = (datetime.utcnow() + timedelta(hours=7)).strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = (datetime.now(timezone.utc) + timedelta(hours=7)).strftime("%Y-%m-%d %H:%M:%S")
 
-    # Luôn tạo file mới với header
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "datetime", "city",
-            "temp", "humidity", "weather", "wind_speed",
-            "aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10"
+    # Gọi song song API thời tiết + không khí cho tất cả thành phố (I/O mạng độc lập)
+    with ThreadPoolExecutor(max_workers=len(CITIES) * 2) as ex:
+        futures = {
+            city: (
+                ex.submit(get_weather, coords["lat"], coords["lon"]),
+                ex.submit(get_air_quality, coords["lat"], coords["lon"]),
+            )
+            for city, coords in CITIES.items()
+        }
+
+    rows = []
+    for city, (f_weather, f_air) in futures.items():
+        weather = f_weather.result()
+        air = f_air.result()
+        rows.append([
+            timestamp, city,
+            weather["temp"], weather["humidity"], weather["weather"], weather["wind_speed"],
+            air["aqi"], air["co"], air["no"], air["no2"], air["o3"], air["so2"], air["pm2_5"], air["pm10"]
         ])
 
-        for city, coords in CITIES.items():
-            weather = get_weather(coords["lat"], coords["lon"])
-            air = get_air_quality(coords["lat"], coords["lon"])
+    # Dữ liệu (bỏ cột datetime) giống hệt file hiện có -> kết quả từ cache, không ghi lại
+    if same_data(rows):
+        print(f"♻️ Không có dữ liệu mới, giữ nguyên {CSV_FILE}")
+        return
 
-            row = [
-                timestamp, city,
-                weather["temp"], weather["humidity"], weather["weather"], weather["wind_speed"],
-                air["aqi"], air["co"], air["no"], air["no2"], air["o3"], air["so2"], air["pm2_5"], air["pm10"]
-            ]
-            writer.writerow(row)
+    # Luôn tạo file mới với header; ghi 1 lần sau khi đã có đủ dữ liệu (không giữ file mở khi gọi API)
+    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
 
     print(f"✅ Dữ liệu đã được lưu vào {CSV_FILE}")
 
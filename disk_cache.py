@@ -0,0 +1,80 @@
+"""
+disk_cache.py
+- Cache kết quả hàm ra đĩa (pickle) với thời hạn TTL
+- Dùng chung cho air_quality.py (gọi API) và supabase_descriptive_stats.py (đọc DB)
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+# 📂 Thư mục lưu cache (đổi bằng biến môi trường CACHE_DIR nếu cần)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ".cache"))
+# 🚫 Bỏ qua cache khi đọc (vẫn ghi kết quả mới): đặt NO_CACHE=1 hoặc gọi bypass_cache()
+BYPASS = os.getenv("NO_CACHE", "").strip().lower() not in ("", "0", "false", "no")
+_PRINT_LOCK = threading.Lock()  # các hàm cache được gọi từ nhiều thread -> tránh in chồng dòng
+
+
+def bypass_cache(on=True):
+    """Bật/tắt chế độ bỏ qua cache cho mọi hàm dùng @disk_cache (ví dụ khi có cờ --no-cache)."""
+    global BYPASS
+    BYPASS = on
+
+
+def disk_cache(ttl_seconds=3600, ignore=(), key_version=1):
+    """
+    Decorator: lưu giá trị trả về vào CACHE_DIR/<hash>.pkl, dùng lại nếu file còn trong hạn ttl_seconds.
+    - Key = tên hàm + các tham số (bỏ qua những tham số có tên trong `ignore`, ví dụ kết nối DB) + key_version
+    - Tăng key_version mỗi khi đổi dạng giá trị trả về, để không đọc nhầm pickle của phiên bản cũ
+    - ttl_seconds <= 0 -> tắt cache hoàn toàn; BYPASS -> không đọc cache nhưng vẫn ghi kết quả mới
+    - Hàm ném exception thì không ghi cache; lỗi đọc/ghi cache không bao giờ làm hỏng lời gọi hàm
+    """
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if ttl_seconds <= 0:
+                return func(*args, **kwargs)
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_args = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            raw = f"{func.__module__}.{func.__qualname__}:v{key_version}:{key_args!r}".encode("utf-8")
+            path = CACHE_DIR / f"{hashlib.blake2b(raw, digest_size=16).hexdigest()}.pkl"
+
+            try:
+                age = time.time() - path.stat().st_mtime
+            except OSError:
+                age = None  # chưa có cache
+            if not BYPASS and age is not None and age < ttl_seconds:
+                try:
+                    with open(path, "rb") as f:
+                        result = pickle.load(f)
+                    with _PRINT_LOCK:
+                        print(f"♻️  {func.__name__}: dùng cache ({age / 60:.0f} phút trước)")
+                    return result
+                except Exception:
+                    pass  # file hỏng -> tính lại
+
+            result = func(*args, **kwargs)
+            # Cache là tuỳ chọn: không ghi được (thư mục read-only, lỗi pickle...) thì vẫn trả kết quả
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                with open(tmp, "wb") as f:
+                    pickle.dump(result, f)
+                os.replace(tmp, path)
+            except Exception:
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+            return result
+
+        return wrapper
+    return decorator